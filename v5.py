@@ -1,12 +1,19 @@
 import sys
+import re
+import html
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import requests
 from bs4 import BeautifulSoup
 import os
+import posixpath
 import threading
 import urllib.parse
 import json
+import pickle
+import queue
+import time
+from collections import deque
 from datetime import datetime
 import logging
 from requests.adapters import HTTPAdapter
@@ -15,13 +22,39 @@ import subprocess
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 
+try:
+    import orjson  # 可选依赖，安装后加快下载历史的读写
+except ImportError:
+    orjson = None
+
+# 目录索引页中的<pre>块
+_PRE_RE = re.compile(r'<pre[^>]*>(.*?)(?:</pre>|\Z)', re.IGNORECASE | re.DOTALL)
+# <pre>块中的每一行：链接地址、显示名称、链接后面的日期/大小文本
+_ROW_RE = re.compile(r'<a\s+href="([^"]*)"[^>]*>([^<]*)</a>([^<\n]*)', re.IGNORECASE)
+# 需要跳过的当前/上级目录链接
+_SKIP_NAMES = frozenset((".", ".."))
+_SKIP_HREFS = frozenset(("../", "..", "./", "."))
+
+
+class DownloadCancelled(Exception):
+    """用户取消下载时抛出"""
+
+
 class AstronomyDBBrowser:
     def __init__(self, root):
         # 常量定义
         self.INVALID_CHARS = '/\\:*?"<>|'  # 无效文件名字符
+        self._invalid_char_table = str.maketrans({c: '_' for c in self.INVALID_CHARS})  # 非法字符替换表
         self.DATE_FORMAT = "%d-%b-%Y %H:%M"  # 日期解析格式
         self.DEFAULT_WINDOW_SIZE = "1200x700"  # 默认窗口大小
         self.MAX_HISTORY = 1000  # 最大历史记录数
+        self.HISTORY_COMPACT_THRESHOLD = 1000  # 历史文件中多出的旧记录超过该数量时重写文件
+        self.CACHE_COMPACT_THRESHOLD = 200  # 增量缓存条目超过该数量时合并到主缓存文件
+        self.MAX_PREFETCHED_LISTINGS = 256  # 最多同时预取（尚未取用）的目录列表数
+        self.MAX_DIRECTORY_DEPTH = 32  # 下载目录时最多进入的子目录层数（防止服务器上的链接循环）
+        self.RENDER_BATCH_SIZE = 100  # 目录列表每批插入Treeview的行数
+        self.PARALLEL_DOWNLOAD_THRESHOLD = 32 * 1024 * 1024  # 超过该大小的文件分段并行下载
+        self.RANGE_DOWNLOAD_PARTS = 4  # 大文件分段数
         
         self.root = root
         self.root.title("星明天文台数据库浏览工具")
@@ -54,15 +87,50 @@ class AstronomyDBBrowser:
         }
         
         # 初始化功能相关变量
-        self.download_history = []  # 下载历史
+        self.download_history = deque(maxlen=self.MAX_HISTORY)  # 下载历史（最新的在前）
+        self._history_lock = threading.Lock()  # 并发下载时保护下载历史的修改和保存
+        self._history_dirty = False  # 下载历史是否有未写入磁盘的修改
+        self._pending_history = []  # 尚未追加到历史文件的新记录
+        self._history_rewrite = False  # 是否需要重写整个历史文件（删除/清空记录后）
+        self._history_lines = 0  # 历史文件当前的行数
+        self._history_flush_after_id = None  # 延迟写入下载历史的定时任务ID
+        self.cancel_download = False  # 取消下载标志
+        self._progress_lock = threading.Lock()  # 保护待刷新的进度和状态
+        self._pending_progress = None  # 待显示的进度值
+        self._pending_status = None  # 待显示的状态文本
+        self._progress_scheduled = False  # 是否已安排刷新
+        self._cache_lock = threading.Lock()  # 保护目录缓存的读写
+        self._cache_dirty = False  # 目录缓存是否有未写入磁盘的修改
+        self._flush_after_id = None  # 延迟写入缓存的定时任务ID
         
         # 加载用户设置和数据
         self.load_settings()
         self.load_download_history()
+        # 目录缓存只在启动时加载一次（切换数据库时重新加载会丢失尚未写入磁盘的条目）
+        self.load_directory_cache()
+        
+        # 全局共享的HTTP会话（复用连接池，避免每次请求重新握手）
+        self.http = self._create_retry_session()
+        
+        # 各线程池的大小都取自最大并发任务数，避免同时向服务器发起过多连接
+        max_workers = self.settings.get("max_concurrent_tasks", 3)
+        
+        # 预取目录列表的线程池（下载目录时与文件下载并行获取子目录列表）
+        self.list_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='listing')
+        self._listing_lock = threading.Lock()
+        self._listing_futures = {}  # URL -> Future，取用后移除
+        
+        # 所有文件下载共用的线程池（批量下载中的单个文件和目录中的文件）
+        self.download_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='download')
+        # 大文件分段并行下载的线程池
+        self.range_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='range')
         
         # 初始化组件（先显示数据库选择界面）
         self.show_db_selector()
         
+        # 绑定窗口关闭事件（保存设置、缓存和下载历史）
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
         # 确保下载目录存在
         os.makedirs(self.settings["download_dir"], exist_ok=True)
     
@@ -134,34 +202,70 @@ class AstronomyDBBrowser:
     def cleanup_expired_cache(self):
         """清理过期的目录缓存"""
         try:
-            # 复制一份缓存字典以避免在迭代时修改
-            current_cache = self.directory_cache.copy()
-            expired_count = 0
-            for url in current_cache:
-                if not self.is_cache_valid(url):
+            now = time.time()  # 整个清理过程只取一次当前时间
+            with self._cache_lock:
+                # 先收集过期的URL再统一删除，避免在迭代时修改字典
+                expired = [url for url in self.directory_cache if not self.is_cache_valid(url, now)]
+                for url in expired:
                     del self.directory_cache[url]
-                    expired_count += 1
-            if expired_count > 0:
-                self.save_directory_cache()
-                logging.info(f"清理了 {expired_count} 个过期的缓存条目")
+            if expired:
+                self.save_directory_cache(compact=True)
+                logging.info(f"清理了 {len(expired)} 个过期的缓存条目")
         except Exception as e:
             logging.error(f"清理过期缓存时出错: {e}")
 
     def on_closing(self):
         """窗口关闭时保存设置和清理过期缓存"""
+        # 先停止正在进行的下载，线程池中排队的任务开始后也会立即退出
+        self.cancel_download = True
         self.save_settings()
+        if self._flush_after_id is not None:
+            self.root.after_cancel(self._flush_after_id)
+        self._flush_cache_if_dirty(background=False)
+        if self._history_flush_after_id is not None:
+            self.root.after_cancel(self._history_flush_after_id)
+        self._flush_history_if_dirty(background=False)
         self.cleanup_expired_cache()
+        self._clear_prefetched_listings()
+        for pool in (self.list_pool, self.download_pool, self.range_pool):
+            self._shutdown_pool(pool)
         self.root.destroy()
 
+    def _shutdown_pool(self, pool):
+        """关闭线程池并取消尚未开始的任务（线程池的线程不是守护线程，排队的任务会拖延程序退出）"""
+        if sys.version_info >= (3, 9):
+            pool.shutdown(wait=False, cancel_futures=True)
+            return
+        # Python 3.8的shutdown没有cancel_futures参数，手动取出排队的任务并取消
+        while True:
+            try:
+                work_item = pool._work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if work_item is not None:
+                work_item.future.cancel()
+        pool.shutdown(wait=False)
+
     def _create_retry_session(self):
-        """创建带重试机制的请求会话"""
+        """创建带重试机制和连接池的请求会话（整个程序共用一个）"""
         session = requests.Session()
+        session.headers["User-Agent"] = "XOSS-Database-Browser/1.2"
         retry = Retry(
             total=3,  # 重试3次
-            backoff_factor=1,  # 每次重试间隔1秒
-            status_forcelist=[429, 500, 502, 503, 504]  # 针对这些状态码重试
+            backoff_factor=0.5,  # 重试间隔按0.5秒指数递增
+            status_forcelist=[429, 500, 502, 503, 504],  # 针对这些状态码重试
+            allowed_methods=frozenset(["GET", "HEAD"]),  # 目录列表、下载和大小校验请求都可重试
+            respect_retry_after_header=True  # 服务器限流时按Retry-After等待
+        )
+        # 连接池大小需覆盖同时访问服务器的所有线程：文件下载、分段下载、目录预取
+        # 三个线程池（大小均为最大并发任务数），另加浏览目录时的请求，
+        # 否则多出的连接用完即被丢弃，无法复用
+        max_workers = self.settings.get("max_concurrent_tasks", 3)
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=3 * max_workers + 4,
+            max_retries=retry
         )
-        adapter = HTTPAdapter(max_retries=retry)
         session.mount('http://', adapter)
         session.mount('https://', adapter)
         return session
@@ -248,6 +352,7 @@ class AstronomyDBBrowser:
             selected_db_name = self.db_var.get()
             self.base_url = self.db_list[selected_db_name]
             self.path_stack = [self.base_url]  # 初始化路径栈
+            self.path_set = {self.base_url}  # 路径栈中的URL集合，用于快速判断
             
             # 销毁旧组件
             for widget in self.root.winfo_children():
@@ -304,6 +409,9 @@ class AstronomyDBBrowser:
         self.main_frame.pack(fill=tk.BOTH, expand=True)
 
         self.columns = ("name", "date", "size", "type")
+        self._sort_keys = {}  # 行ID -> 各列的排序键（插入时预先计算）
+        self._row_sizes = {}  # 行ID -> 目录列表中的精确文件大小（字节）
+        self._render_generation = 0  # 渲染编号，切换目录后用于停止旧的分批插入
         self.tree = ttk.Treeview(
             self.main_frame, 
             columns=self.columns, 
@@ -407,9 +515,6 @@ class AstronomyDBBrowser:
         
         # 绑定窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
-        
-        # 初始化目录缓存
-        self.load_directory_cache()
 
     def _setup_styles(self):
         """设置界面样式"""
@@ -422,32 +527,85 @@ class AstronomyDBBrowser:
         style.configure("TLabelframe.Label", font=("SimHei", 10, "bold"))
 
     def load_directory_cache(self):
-        """加载目录缓存"""
+        """加载目录缓存（主缓存文件 + 增量文件）"""
+        self.cache_file = os.path.join(self.appdata_dir, "directory_cache.pkl")
+        self.cache_delta_file = os.path.join(self.appdata_dir, "directory_cache.delta")
+        self._dirty_urls = set()  # 尚未写入磁盘的缓存条目
+        self._cache_delta_count = 0  # 增量文件中的条目数
         try:
-            self.cache_file = os.path.join(self.appdata_dir, "directory_cache.json")
             if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.directory_cache = json.load(f)
+                with open(self.cache_file, 'rb') as f:
+                    self.directory_cache = pickle.load(f)
             else:
                 self.directory_cache = {}
         except Exception as e:
             logging.error(f"加载目录缓存失败: {e}")
             self.directory_cache = {}
+        
+        # 回放增量文件中的条目（后写入的覆盖先写入的）
+        if os.path.exists(self.cache_delta_file):
+            try:
+                delta_size = os.path.getsize(self.cache_delta_file)
+                with open(self.cache_delta_file, 'rb') as f:
+                    while f.tell() < delta_size:
+                        url, entry = pickle.load(f)
+                        self.directory_cache[url] = entry
+                        self._cache_delta_count += 1
+            except Exception as e:
+                # 程序异常退出时最后一条记录可能不完整，忽略其后的内容；
+                # 立即合并到主缓存文件并删除增量文件，否则之后追加的条目都无法读取
+                logging.warning(f"读取增量缓存中断: {e}")
+                self.save_directory_cache(compact=True)
+
+    def save_directory_cache(self, compact=False):
+        """保存目录缓存：平时只追加变化的条目，增量过多或compact=True时重写主缓存文件"""
+        with self._cache_lock:
+            try:
+                if compact or self._cache_delta_count + len(self._dirty_urls) > self.CACHE_COMPACT_THRESHOLD:
+                    tmp_file = self.cache_file + ".tmp"
+                    with open(tmp_file, 'wb') as f:
+                        pickle.dump(self.directory_cache, f, protocol=5)
+                    os.replace(tmp_file, self.cache_file)
+                    if os.path.exists(self.cache_delta_file):
+                        os.remove(self.cache_delta_file)
+                    self._cache_delta_count = 0
+                else:
+                    with open(self.cache_delta_file, 'ab') as f:
+                        for url in self._dirty_urls:
+                            if url in self.directory_cache:
+                                pickle.dump((url, self.directory_cache[url]), f, protocol=5)
+                                self._cache_delta_count += 1
+                self._dirty_urls.clear()
+            except Exception as e:
+                logging.error(f"保存目录缓存失败: {e}")
+
+    def _schedule_cache_flush(self):
+        """标记缓存已修改，安排写入磁盘，2秒内的多次修改合并为一次写入"""
+        self._cache_dirty = True
+        # 已安排写入时不再推迟，持续预取目录时也能定期写入
+        if self._flush_after_id is None:
+            self._flush_after_id = self.root.after(2000, self._flush_cache_if_dirty)
+
+    def _flush_cache_if_dirty(self, background=True):
+        """缓存有修改时写入磁盘（默认在后台线程执行，避免阻塞界面）"""
+        self._flush_after_id = None
+        if not self._cache_dirty:
+            return
+        self._cache_dirty = False
+        if background:
+            threading.Thread(target=self.save_directory_cache, daemon=True).start()
+        else:
+            self.save_directory_cache()
 
-    def save_directory_cache(self):
-        """保存目录缓存"""
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.directory_cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error(f"保存目录缓存失败: {e}")
-
-    def is_cache_valid(self, url):
-        """检查缓存是否有效（有效期24小时）"""
-        if url not in self.directory_cache or "cache_time" not in self.directory_cache[url]:
+    def is_cache_valid(self, url, now=None):
+        """检查缓存是否有效（有效期24小时），now为当前时间戳，批量检查时由调用方传入"""
+        entry = self.directory_cache.get(url)
+        # 不存在或旧格式（字符串时间）的缓存视为无效
+        if not entry or not isinstance(entry.get("cache_time"), (int, float)):
             return False
-        cache_time = datetime.strptime(self.directory_cache[url]["cache_time"], "%Y-%m-%d %H:%M:%S")
-        return (datetime.now() - cache_time).total_seconds() < 86400  # 24小时
+        if now is None:
+            now = time.time()
+        return now - entry["cache_time"] < 86400  # 24小时
 
     def refresh_current_directory(self):
         """刷新当前目录"""
@@ -457,6 +615,7 @@ class AstronomyDBBrowser:
     def load_current_directory(self):
         """加载当前目录内容"""
         self.status_label.config(text="加载中...")
+        # 目录页的请求和解析都在后台守护线程中进行，不阻塞界面；某个目录请求卡住时也不影响继续浏览
         threading.Thread(
             target=self._fetch_directory_contents, 
             args=(self.path_stack[-1],), 
@@ -479,61 +638,10 @@ class AstronomyDBBrowser:
                 self._render_directory(dir_items, current_url)
                 return
 
-            # 缓存无效或不存在，请求网络
+            # 缓存无效或不存在，请求网络（过期缓存带有校验信息时发送条件请求）
             if not current_url.endswith('/'):
                 current_url += '/'
-                
-            session = self._create_retry_session()
-            response = session.get(current_url, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            pre = soup.find('pre')
-            if not pre:
-                raise ValueError("未找到目录列表")
-            
-            # 解析目录内容
-            a_tags = pre.find_all('a')
-            dir_items = []  # 存储解析后的目录项
-            
-            for a in a_tags:
-                # 安全获取属性值
-                name = a.text.strip() if a.text else ""
-                href = a.get('href', "")  # 使用get方法避免KeyError
-                
-                # 过滤无效项
-                if self._should_skip_item(name, href):
-                    continue
-                
-                # 构造完整URL
-                if not href:
-                    continue
-                    
-                full_url = urllib.parse.urljoin(current_url, href)
-                
-                # 解析日期和大小
-                date, size = self._parse_file_info(a)
-                
-                # 判断是否为目录
-                file_type = "目录" if name.endswith('/') or href.endswith('/') else "文件"
-                
-                # 添加到目录项列表
-                dir_items.append({
-                    "name": name,
-                    "href": href,
-                    "date": date,
-                    "size": size,
-                    "file_type": file_type,
-                    "full_url": full_url
-                })
-            
-            # 更新缓存
-            if hasattr(self, 'directory_cache'):
-                 self.directory_cache[current_url] = {
-                     "dir_items": dir_items,
-                     "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                 }
-                 self.save_directory_cache()
+            dir_items = self._fetch_and_parse(current_url)
 
             # 渲染目录
             self._render_directory(dir_items, current_url)
@@ -542,53 +650,201 @@ class AstronomyDBBrowser:
             self._update_status(f"加载失败: {str(e)}")
             self._show_error(f"无法加载目录: {str(e)}")
 
-    def _should_skip_item(self, name, href):
-        """判断是否应该跳过当前项（上级目录或无效项）"""
-        skip_conditions = [
-            name in (".", ".."),
-            href in ("../", "..", "./", "."),
-            href.startswith("../") and len(href) > 3,
-            "parent directory" in name.lower(),
-            "上级目录" in name
-        ]
-        return any(skip_conditions)
+    def _fetch_and_parse(self, url):
+        """请求并解析目录索引页，返回目录项列表
+        
+        目录已有缓存时发送条件请求，服务器返回304时直接使用缓存的目录项；结果写回目录缓存
+        """
+        if not url.endswith('/'):
+            url += '/'
+        
+        cached = None
+        if hasattr(self, 'directory_cache'):
+            cached = self.directory_cache.get(url)
+        entry = self._request_listing(url, cached)
+        
+        # 更新缓存
+        if hasattr(self, 'directory_cache'):
+            with self._cache_lock:
+                self.directory_cache[url] = entry
+                self._dirty_urls.add(url)
+            self._schedule_cache_flush()
+        
+        return entry["dir_items"]
+
+    def _request_listing(self, url, cached=None):
+        """请求目录索引页并生成缓存条目
+        
+        cached为该URL已有的缓存条目，带有ETag/Last-Modified时发送条件请求，
+        服务器返回304时直接沿用缓存的目录项，不再下载和解析页面
+        """
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
+        response = self.http.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and cached:
+            logging.info(f"目录未修改，沿用缓存: {url}")
+            # 兼容旧缓存格式，优先使用dir_items，如果不存在则使用content
+            dir_items = cached.get("dir_items", cached.get("content", []))
+            etag = response.headers.get("ETag", cached.get("etag"))
+            last_modified = response.headers.get("Last-Modified", cached.get("last_modified"))
+        else:
+            response.raise_for_status()
+            # 响应头未声明编码时直接按UTF-8解码，避免requests回退到默认编码或逐字节猜测编码
+            if "charset" not in response.headers.get("Content-Type", "").lower():
+                response.encoding = "utf-8"
+            dir_items = self._parse_index(response.text, url)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        
+        return {
+            "dir_items": dir_items,
+            "cache_time": time.time(),
+            "etag": etag,
+            "last_modified": last_modified
+        }
 
-    def _parse_file_info(self, a_tag):
-        """解析文件的日期和大小信息"""
-        date = "未知"
-        size = "未知"
+    def _prefetch_listing(self, url):
+        """提交后台任务预取目录列表，已达到预取数量上限时不提交并返回False
+        
+        不丢弃已有的预取结果：按顺序遍历时最早提交的正是接下来要用的
+        """
+        with self._listing_lock:
+            if url in self._listing_futures:
+                return True
+            if len(self._listing_futures) >= self.MAX_PREFETCHED_LISTINGS:
+                return False
+            self._listing_futures[url] = self.list_pool.submit(self._fetch_and_parse, url)
+            return True
+
+    def _get_listing(self, url):
+        """获取目录列表（优先使用预取结果，没有则直接请求）"""
+        with self._listing_lock:
+            future = self._listing_futures.pop(url, None)
+        if future is None or future.cancelled():
+            return self._fetch_and_parse(url)
+        return future.result()
+
+    def _clear_prefetched_listings(self):
+        """取消并清空所有预取任务"""
+        with self._listing_lock:
+            for future in self._listing_futures.values():
+                future.cancel()
+            self._listing_futures.clear()
+
+    def _parse_index(self, html_text, base_url):
+        """解析目录索引页（优先用正则直接扫描<pre>块，不构建DOM树）"""
+        pre = _PRE_RE.search(html_text)
+        rows = _ROW_RE.findall(pre.group(1)) if pre else []
+        unescape = html.unescape
+        if not rows:
+            # 非标准格式的索引页（如表格形式），退回到BeautifulSoup解析
+            rows = self._parse_index_rows_bs4(html_text)
+            unescape = str  # BeautifulSoup已解码HTML实体
+            if not pre and not rows:
+                raise ValueError("未找到目录列表")
         
-        next_sibling = a_tag.next_sibling
-        if next_sibling:
-            next_sibling = next_sibling.strip()
-            if next_sibling:
-                parts = next_sibling.split()
-                if len(parts) >= 3:
-                    date = ' '.join(parts[:2])
-                    size = parts[2] if parts[2] != '-' else "未知"
+        dir_items = []  # 存储解析后的目录项
+        urljoin = urllib.parse.urljoin
+        for href, name, info_text in rows:
+            # 过滤无效项（先检查链接，命中时无需再处理名称）
+            href = unescape(href)
+            if not href or href in _SKIP_HREFS or href.startswith("../"):
+                continue
+            name = unescape(name).strip()
+            if name in _SKIP_NAMES or "parent directory" in name.lower() or "上级目录" in name:
+                continue
+            
+            # 解析链接后面的日期和大小（格式：日期 时间 大小）
+            date = "未知"
+            size = "未知"
+            parts = info_text.split()
+            if len(parts) >= 3:
+                date = parts[0] + " " + parts[1]
+                if parts[2] != "-":
+                    size = parts[2]
+            
+            # 添加到目录项列表
+            dir_items.append({
+                "name": name,
+                "href": href,
+                "date": date,
+                "size": size,
+                # 列表给出精确字节数时记录下来，用于跳过已完整下载的文件
+                "size_bytes": int(size) if size.isdigit() else None,
+                "file_type": "目录" if name.endswith('/') or href.endswith('/') else "文件",
+                "full_url": urljoin(base_url, href)
+            })
         
-        return date, size
+        return dir_items
+
+    def _parse_index_rows_bs4(self, html_text):
+        """用BeautifulSoup提取索引页中的链接，返回(链接地址, 名称, 日期/大小文本)列表"""
+        soup = BeautifulSoup(html_text, 'html.parser')
+        container = soup.find('pre') or soup
+        rows = []
+        for a in container.find_all('a', href=True):
+            tr = a.find_parent('tr')
+            if tr:
+                # 表格形式：链接所在单元格之后的各列依次为日期、大小等
+                td = a.find_parent('td')
+                cells = td.find_next_siblings('td') if td else []
+                info_text = " ".join(cell.get_text(" ", strip=True) for cell in cells)
+            else:
+                info_text = a.next_sibling if isinstance(a.next_sibling, str) else ""
+            rows.append((a['href'], a.get_text(), info_text))
+        return rows
 
     def _render_directory(self, dir_items, current_url):
-        """渲染目录内容到Treeview"""
-        # 在主线程中更新UI
-        def update_ui():
-            # 清空Treeview
-            for item in self.tree.get_children():
-                self.tree.delete(item)
+        """渲染目录内容到Treeview（分批插入，大目录加载时界面仍可响应）"""
+        # 在主线程中插入一批目录项，未插完时在空闲时继续下一批
+        def insert_batch(start, generation):
+            # 已开始渲染其他目录时停止
+            if generation != self._render_generation:
+                return
             
-            # 添加目录项
-            for item in dir_items:
-                self.tree.insert(
+            for item in dir_items[start:start + self.RENDER_BATCH_SIZE]:
+                item_id = self.tree.insert(
                     "", 
                     tk.END, 
                     values=(item["name"], item["date"], item["size"], item["file_type"]), 
                     tags=(item["full_url"],)
                 )
+                # 预先计算排序键，排序时无需再解析日期和大小
+                self._sort_keys[item_id] = (
+                    item["name"].lower(),
+                    self._parse_date_key(item["date"]),
+                    self._parse_size_key(item["size"]),
+                    item["file_type"]
+                )
+                self._row_sizes[item_id] = item.get("size_bytes")
+            
+            next_start = start + self.RENDER_BATCH_SIZE
+            if next_start < len(dir_items):
+                self.status_label.config(text=f"加载中... ({next_start}/{len(dir_items)})")
+                self.root.after_idle(insert_batch, next_start, generation)
+            else:
+                self.status_label.config(text=f"当前目录: {current_url} (共 {len(dir_items)} 项)")
+                # 全部插入后才允许下载整个目录
+                self.download_all_btn.config(state=tk.NORMAL)
+        
+        # 在主线程中清空并开始渲染
+        def update_ui():
+            self._render_generation += 1
             
-            # 更新状态
-            self.status_label.config(text=f"当前目录: {current_url} (共 {len(dir_items)} 项)")
+            # 清空Treeview（一次调用删除全部行）
+            self.tree.delete(*self.tree.get_children())
+            self._sort_keys = {}
+            self._row_sizes = {}
             self.back_btn.config(state=tk.NORMAL if len(self.path_stack) > 1 else tk.DISABLED)
+            # 未插入完时Treeview中只有部分行，此时下载整个目录会漏掉其余的项
+            self.download_all_btn.config(state=tk.DISABLED)
+            
+            insert_batch(0, self._render_generation)
         
         self.root.after(0, update_ui)
 
@@ -603,53 +859,47 @@ class AstronomyDBBrowser:
         file_url = self.tree.item(item, "tags")[0]
         
         if file_type == "目录":
-            if file_url not in self.path_stack:
+            if file_url not in self.path_set:
                 self.path_stack.append(file_url)
+                self.path_set.add(file_url)
                 self.load_current_directory()
 
     def go_back(self):
         """返回上级目录"""
         if len(self.path_stack) > 1:
-            self.path_stack.pop()
+            self.path_set.discard(self.path_stack.pop())
             self.load_current_directory()
 
+    def _parse_date_key(self, date_str):
+        """将日期字符串转换为排序键"""
+        try:
+            return datetime.strptime(date_str, self.DATE_FORMAT)
+        except:
+            return datetime.min
+
+    def _parse_size_key(self, size_str):
+        """将大小字符串（如1.5K、20M）转换为字节数排序键"""
+        try:
+            if size_str == "未知":
+                return 0
+            if size_str.endswith("K"):
+                return float(size_str[:-1]) * 1024
+            if size_str.endswith("M"):
+                return float(size_str[:-1]) * 1024 * 1024
+            if size_str.endswith("G"):
+                return float(size_str[:-1]) * 1024 * 1024 * 1024
+            return float(size_str)
+        except:
+            return 0
+
     def sort_column(self, col, reverse):
-        """按列排序"""
-        # 获取列数据
+        """按列排序（使用插入时预先计算的排序键）"""
+        col_index = self.columns.index(col)
         data = [
-            (self.tree.set(child, col), child)
+            (self._sort_keys[child][col_index], child)
             for child in self.tree.get_children()
         ]
-        
-        # 特殊处理日期列
-        if col == "date":
-            def parse_date(date_str):
-                try:
-                    return datetime.strptime(date_str, self.DATE_FORMAT)
-                except:
-                    return datetime.min
-                    
-            data.sort(key=lambda x: parse_date(x[0]), reverse=reverse)
-        # 特殊处理大小列
-        elif col == "size":
-            def parse_size(size_str):
-                try:
-                    if size_str == "未知":
-                        return 0
-                    if size_str.endswith("K"):
-                        return float(size_str[:-1]) * 1024
-                    if size_str.endswith("M"):
-                        return float(size_str[:-1]) * 1024 * 1024
-                    if size_str.endswith("G"):
-                        return float(size_str[:-1]) * 1024 * 1024 * 1024
-                    return float(size_str)
-                except:
-                    return 0
-                    
-            data.sort(key=lambda x: parse_size(x[0]), reverse=reverse)
-        else:
-            # 默认排序（字符串）
-            data.sort(reverse=reverse)
+        data.sort(key=lambda x: x[0], reverse=reverse)
         
         # 重新排列项目
         for i, (val, child) in enumerate(data):
@@ -671,10 +921,10 @@ class AstronomyDBBrowser:
         messagebox.showinfo("关于", about_text)
 
     def _update_status(self, text):
-        """在主线程中更新状态标签"""
-        def update():
-            self.status_label.config(text=text)
-        self.root.after(0, update)
+        """在主线程中更新状态标签（与进度条更新合并刷新）"""
+        with self._progress_lock:
+            self._pending_status = text
+            self._schedule_progress_flush()
 
     def _show_error(self, message):
         """在主线程中显示错误消息"""
@@ -745,7 +995,8 @@ class AstronomyDBBrowser:
             self._update_status(f"正在下载 ({index+1}/{total}): {file_name}")
             
             if file_type == "目录":
-                dir_path = os.path.join(self.download_dir, file_name.rstrip('/'))
+                # 目录名取自URL（列表中显示的名称可能被截断）
+                dir_path = os.path.join(self.download_dir, self._local_dir_name(file_url))
                 self._download_directory(file_url, dir_path)
                 return True, file_name, None
             else:
@@ -757,16 +1008,17 @@ class AstronomyDBBrowser:
                     # 对目录名进行URL解码
                     dir_name = urllib.parse.unquote(dir_name)
                     # 过滤目录名非法字符
-                    for c in self.INVALID_CHARS:
-                        dir_name = dir_name.replace(c, '_')
+                    dir_name = dir_name.translate(self._invalid_char_table)
                     # 创建目录文件夹
                     file_dir = os.path.join(self.download_dir, dir_name)
                     os.makedirs(file_dir, exist_ok=True)
                 else:
                     # 如果无法提取目录名，则直接使用下载目录
                     file_dir = self.download_dir
-                # 下载文件到目录文件夹
-                self._download_file(file_url, file_dir, show_msg=False)
+                # 下载文件到目录文件夹（在共用的下载线程池中执行，总并发数不超过设置值）
+                self.download_pool.submit(
+                    self._download_file, file_url, file_dir, False, self._row_sizes.get(item)
+                ).result()
                 return True, file_name, None
         except Exception as e:
             return False, file_name, str(e)
@@ -788,22 +1040,17 @@ class AstronomyDBBrowser:
         cancel_btn.pack(side=tk.LEFT, padx=5)
         
         try:
-            # 使用线程池控制并发下载
-            max_workers = self.settings.get("max_concurrent_tasks", 3)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有下载任务
-                futures = []
-                for i, item in enumerate(items):
-                    if self.cancel_download:
-                        break
-                    future = executor.submit(self._download_item, item, total, i)
-                    futures.append(future)
-                
-                # 处理任务结果
-                for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                    if self.cancel_download:
-                        break
-                    
+            # 预取选中目录的列表
+            for item in items:
+                if self.tree.item(item, "values")[3] == "目录":
+                    self._prefetch_listing(self.tree.item(item, "tags")[0])
+            
+            # 处理已完成任务的结果
+            completed = 0
+            def handle_done(done):
+                nonlocal success, fail, completed
+                for future in done:
+                    completed += 1
                     try:
                         result, file_name, error = future.result()
                         if result:
@@ -811,14 +1058,41 @@ class AstronomyDBBrowser:
                         else:
                             fail += 1
                             fail_list.append(f"{file_name}: {error}")
-                            self._update_status(f"下载失败 ({i+1}/{total}): {file_name}")
+                            self._update_status(f"下载失败 ({completed}/{total}): {file_name}")
                         
                         # 更新进度条
-                        self._update_progress(int((i+1)/total * 100))
+                        self._update_progress(int(completed/total * 100))
                     except Exception as e:
                         fail += 1
-                        fail_list.append(f"任务{i+1}: {str(e)}")
-                        self._update_status(f"任务出错 ({i+1}/{total})")
+                        fail_list.append(f"任务{completed}: {str(e)}")
+                        self._update_status(f"任务出错 ({completed}/{total})")
+            
+            # 使用线程池控制并发下载，同时排队的任务数不超过线程数的2倍
+            max_workers = self.settings.get("max_concurrent_tasks", 3)
+            max_pending = 2 * max_workers
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = set()
+                for i, item in enumerate(items):
+                    if self.cancel_download:
+                        break
+                    # 队列已满时先等待至少一个任务完成
+                    if len(pending) >= max_pending:
+                        done, pending = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        handle_done(done)
+                    pending.add(executor.submit(self._download_item, item, total, i))
+                
+                # 等待剩余任务完成
+                while pending and not self.cancel_download:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    handle_done(done)
+                
+                # 取消时丢弃尚未开始的任务
+                for future in pending:
+                    future.cancel()
             
             # 处理取消情况
             if self.cancel_download:
@@ -835,194 +1109,427 @@ class AstronomyDBBrowser:
             
         finally:
             # 重置进度条和按钮
+            self._clear_prefetched_listings()
             self._update_progress(0)
             self.root.after(0, cancel_btn.destroy)
+            # 本批任务已全部结束，清除取消标志，否则之后单独下载文件（如重新下载）会直接被取消
+            self.cancel_download = False
             self.save_settings()  # 下载完成后保存设置
 
-    def _download_file(self, file_url, save_dir, show_msg=True):
-        """下载单个文件（支持断点续传）"""
+    def _download_file(self, file_url, save_dir, show_msg=True, expected_size=None):
+        """下载单个文件（支持断点续传）
+        
+        expected_size为目录列表中的精确文件大小，本地文件大小与之相同时不再请求服务器校验；
+        之前完整下载过的文件根据历史记录中的ETag/Last-Modified发送条件请求，未修改时直接跳过
+        """
         try:
             file_name = urllib.parse.unquote(file_url.split('/')[-1])
+            file_name = file_name.translate(self._invalid_char_table)
             save_path = os.path.join(save_dir, file_name)
             
+            # 在线程池中排队期间已取消的任务不再发起请求
+            if self.cancel_download:
+                raise DownloadCancelled("下载已取消")
+            
+            # 文件已完整下载时记录历史并返回
+            def already_complete(etag=None, last_modified=None):
+                logging.info(f"文件已完整下载：{file_name}")
+                if show_msg:
+                    self._show_info(f"{file_name} 已完整下载")
+                self.add_download_record(
+                    file_url, save_path, "成功", file_name,
+                    etag=etag, last_modified=last_modified, size=os.path.getsize(save_path)
+                )
+            
+            # 请求头：不压缩传输，保证字节偏移和Content-Length对应文件本身
+            headers = {"Accept-Encoding": "identity"}
+            
             # 检查是否已部分下载
             resume_byte_pos = 0
+            record = None
             if os.path.exists(save_path):
                 resume_byte_pos = os.path.getsize(save_path)
-                # 如果文件已完整下载，直接返回
-                if self._is_file_complete(file_url, resume_byte_pos):
-                    logging.info(f"文件已完整下载：{file_name}")
-                    if show_msg:
-                        self._show_info(f"{file_name} 已完整下载")
-                    self.add_download_record(file_url, save_path, "成功", file_name)
+                # 与目录列表中的大小一致，无需请求服务器
+                if resume_byte_pos == expected_size:
+                    already_complete()
                     return
+                
+                record = self._find_download_record(file_url, save_path)
+                if record and record.get("size") == resume_byte_pos and (record.get("etag") or record.get("last_modified")):
+                    # 之前完整下载过：发送条件请求，文件未修改时服务器返回304
+                    if record.get("etag"):
+                        headers["If-None-Match"] = record["etag"]
+                    if record.get("last_modified"):
+                        headers["If-Modified-Since"] = record["last_modified"]
                 else:
+                    # 没有校验信息：从已下载的位置继续，已完整时服务器返回416
+                    record = None
+                    headers["Range"] = f"bytes={resume_byte_pos}-"
                     logging.info(f"继续下载：{file_name}（已下载 {resume_byte_pos} 字节）")
             
-            # 构造请求头，支持断点续传
-            headers = {"Range": f"bytes={resume_byte_pos}-"} if resume_byte_pos > 0 else {}
-            
-            def reporthook(count, block_size, total_size):
-                # 检查是否需要取消下载
-                if self.cancel_download:
-                    raise Exception("下载已取消")
-                    
-                if total_size <= 0:  # 未知总大小
-                    self._update_progress(0)
-                    self._update_status(f"下载中：{file_name}（大小未知）")
-                else:
-                    # 加上已下载的字节数
-                    total_downloaded = resume_byte_pos + count * block_size
-                    percent = min(int(total_downloaded * 100 / total_size), 100)
-                    self._update_progress(percent)
-                    self._update_status(f"下载中：{file_name}（{percent}%）")
+            # 下载（复用全局会话的连接，流式读取）
+            # 超时：连接10秒，两次读取之间60秒
+            with self.http.get(file_url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if response.status_code == 304 and record:
+                    already_complete(record.get("etag"), record.get("last_modified"))
+                    return
+                if response.status_code == 416 and "Range" in headers:
+                    # Content-Range: bytes */总大小，总大小与本地一致说明已完整下载
+                    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                    if not total.isdigit() or int(total) == resume_byte_pos:
+                        already_complete()
+                        return
+                    raise Exception(f"本地文件大小（{resume_byte_pos}）与服务器文件（{total}）不一致")
+                response.raise_for_status()
+                
+                # 服务器不支持断点续传或文件已修改时会返回完整内容，此时需从头写入
+                if resume_byte_pos > 0 and response.status_code != 206:
+                    resume_byte_pos = 0
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                
+                # 从头下载大文件且服务器支持Range时改为分段并行下载，当前连接不再读取
+                content_length = response.headers.get("Content-Length")
+                parallel = (
+                    resume_byte_pos == 0
+                    and content_length is not None
+                    and int(content_length) > self.PARALLEL_DOWNLOAD_THRESHOLD
+                    and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+                )
+                if not parallel:
+                    downloaded, total_size = self._stream_to_file(response, save_path, resume_byte_pos, file_name)
             
-            # 下载（使用ab模式追加）
-            with open(save_path, 'ab' if resume_byte_pos > 0 else 'wb') as f:
-                req = urllib.request.Request(file_url, headers=headers)
-                with urllib.request.urlopen(req) as response:
-                    while True:
-                        if self.cancel_download:
-                            raise Exception("下载已取消")
-                            
-                        chunk = response.read(1024 * 1024)  # 1MB块
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        # 更新进度
-                        downloaded = resume_byte_pos + f.tell()
-                        total_size = int(response.headers.get('Content-Length', 0)) + resume_byte_pos
-                        if total_size > 0:
-                            percent = min(int(downloaded * 100 / total_size), 100)
-                            self._update_progress(percent)
-                            self._update_status(f"下载中：{file_name}（{percent}%）")
+            if parallel:
+                total_size = int(content_length)
+                try:
+                    downloaded = self._download_ranges(file_url, save_path, total_size, file_name, etag, last_modified)
+                except DownloadCancelled:
+                    raise
+                except Exception as e:
+                    # 分段下载失败（如服务器不返回206）时改为单连接下载
+                    logging.warning(f"分段下载失败，改为单连接下载：{file_name}，错误：{str(e)}")
+                    with self.http.get(file_url, headers={"Accept-Encoding": "identity"}, stream=True, timeout=(10, 60)) as response:
+                        response.raise_for_status()
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                        downloaded, total_size = self._stream_to_file(response, save_path, 0, file_name)
             
-            # 验证文件完整性
-            if not self._is_file_complete(file_url, os.path.getsize(save_path)):
+            # 验证文件完整性（与响应的Content-Length比较，无需再请求服务器）
+            if total_size > 0 and downloaded != total_size:
                 raise Exception("文件下载不完整")
                 
-            # 记录下载历史
-            self.add_download_record(file_url, save_path, "成功", file_name)
+            # 记录下载历史（保存校验信息，下次可用条件请求判断文件是否修改）
+            self.add_download_record(
+                file_url, save_path, "成功", file_name,
+                etag=etag, last_modified=last_modified, size=downloaded
+            )
             
             if show_msg:
                 self._show_info(f"{file_name} 已下载到 {save_dir}")
 
+        except DownloadCancelled:
+            # 单独下载时提示用户，批量下载时由调用方统计
+            if show_msg:
+                self._show_info(f"{file_name} 下载已取消")
+                return
+            raise
         except Exception as e:
-            if "已取消" not in str(e):
-                # 记录失败历史
-                self.add_download_record(file_url, "", "失败", file_name)
-                logging.error(f"下载失败：{file_url}，错误：{str(e)}")
+            # 记录失败历史
+            self.add_download_record(file_url, "", "失败", file_name)
+            logging.error(f"下载失败：{file_url}，错误：{str(e)}")
             
             if show_msg:
                 self._show_error(f"无法下载 {file_url}: {str(e)}")
             raise
 
-    def _is_file_complete(self, file_url, local_size):
-        """检查文件是否已完整下载"""
+    def _stream_to_file(self, response, save_path, resume_byte_pos, file_name):
+        """将响应内容写入文件（resume_byte_pos大于0时追加），返回(已下载字节数, 总大小)，总大小未知时为0"""
+        # 总大小只解析一次，循环中用本地计数跟踪进度
+        content_length = response.headers.get("Content-Length")
+        total_size = resume_byte_pos + int(content_length) if content_length else 0
+        downloaded = resume_byte_pos
+        last_percent = -1
+        
+        # 使用ab模式追加
+        with open(save_path, 'ab' if resume_byte_pos > 0 else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1MB块
+                if self.cancel_download:
+                    raise DownloadCancelled("下载已取消")
+                
+                f.write(chunk)
+                downloaded += len(chunk)
+                # 百分比变化时才更新进度
+                if total_size > 0:
+                    percent = min(downloaded * 100 // total_size, 100)
+                    if percent != last_percent:
+                        last_percent = percent
+                        self._update_progress(percent)
+                        self._update_status(f"下载中：{file_name}（{percent}%）")
+        
+        return downloaded, total_size
+
+    def _download_ranges(self, file_url, save_path, total_size, file_name, etag=None, last_modified=None):
+        """将大文件分成多段并行下载，返回已下载字节数
+        
+        先下载到预分配的.part临时文件，各段按偏移写入，全部完成后才替换为目标文件。
+        各段已写入的字节数记录在.part.json中，取消下载后保留临时文件，下次只请求未完成的部分；
+        其他原因失败时删除临时文件，不会留下大小完整但内容不全的文件
+        """
+        part_path = save_path + ".part"
+        state_path = part_path + ".json"
+        validator = etag or last_modified  # 用于判断服务器上的文件是否与临时文件对应
+        
+        # 读取上次中断时的进度，文件大小或校验信息不一致时从头下载
+        state = None
+        if validator and os.path.exists(part_path) and os.path.getsize(part_path) == total_size:
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("url") != file_url or state.get("size") != total_size or state.get("validator") != validator:
+                    state = None
+            except Exception:
+                state = None
+        
+        if state is None:
+            # 分段数不超过线程数，否则多出的分段只能等其他分段完成
+            parts = max(1, min(self.RANGE_DOWNLOAD_PARTS, self.settings.get("max_concurrent_tasks", 3)))
+            state = {
+                "url": file_url,
+                "size": total_size,
+                "validator": validator,
+                "part_size": -(-total_size // parts),  # 向上取整
+                "written": {}  # 分段起始位置 -> 已写入的字节数
+            }
+            with open(part_path, 'wb') as f:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(f.fileno(), 0, total_size)
+                else:
+                    f.truncate(total_size)
+        else:
+            logging.info(f"继续分段下载：{file_name}（已下载 {sum(state['written'].values())} 字节）")
+        
+        part_size = state["part_size"]
+        written = state["written"]
+        parts = -(-total_size // part_size)
+        progress_lock = threading.Lock()
+        progress = {"downloaded": sum(written.values()), "percent": -1}
+        abort = threading.Event()  # 任一分段失败时通知其他分段停止下载
+        
+        def save_state():
+            """保存各段进度（调用方需持有progress_lock）"""
+            tmp_file = state_path + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_file, state_path)
+        
+        def download_range(start, end):
+            key = str(start)
+            offset = start + written.get(key, 0)
+            # 该段已完成，或其他分段已失败时，不再发起请求
+            if offset > end or abort.is_set():
+                return
+            headers = {"Range": f"bytes={offset}-{end}", "Accept-Encoding": "identity"}
+            if validator:
+                # 文件在下载期间被修改时服务器返回200而不是206
+                headers["If-Range"] = validator
+            with self.http.get(file_url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if response.status_code != 206:
+                    raise Exception(f"服务器未返回分段内容（HTTP {response.status_code}）")
+                with open(part_path, 'r+b') as f:
+                    f.seek(offset)
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        if self.cancel_download:
+                            raise DownloadCancelled("下载已取消")
+                        if abort.is_set():
+                            return
+                        f.write(chunk)
+                        with progress_lock:
+                            written[key] = written.get(key, 0) + len(chunk)
+                            progress["downloaded"] += len(chunk)
+                            percent = min(progress["downloaded"] * 100 // total_size, 100)
+                            if percent == progress["percent"]:
+                                continue
+                            progress["percent"] = percent
+                        self._update_progress(percent)
+                        self._update_status(f"下载中：{file_name}（{percent}%，{parts}段并行）")
+            # 每完成一段保存一次进度，程序异常退出时也只需重新下载未完成的段
+            with progress_lock:
+                save_state()
+        
+        def fetch_range(start, end):
+            try:
+                download_range(start, end)
+            except BaseException:
+                # 立即通知其他分段停止，不必等它们下载完各自的部分
+                abort.set()
+                raise
+        
+        futures = [
+            self.range_pool.submit(fetch_range, start, min(start + part_size, total_size) - 1)
+            for start in range(0, total_size, part_size)
+        ]
         try:
-            response = requests.head(file_url, allow_redirects=True, timeout=10)
-            remote_size = int(response.headers.get('Content-Length', 0))
-            return local_size >= remote_size - 1024  # 允许1KB误差
-        except:
-            return False  # 无法验证时默认重新下载
+            # 任一分段失败时抛出其异常
+            for future in futures:
+                future.result()
+            if progress["downloaded"] != total_size:
+                raise Exception("文件下载不完整")
+        except DownloadCancelled:
+            abort.set()
+            for future in futures:
+                future.cancel()
+            concurrent.futures.wait(futures)  # 等待仍在写入的分段结束后再保存进度
+            # 保留临时文件和进度，下次下载时继续（没有校验信息时无法确认文件未修改，直接删除）
+            with progress_lock:
+                if validator:
+                    save_state()
+                else:
+                    try:
+                        os.remove(part_path)
+                    except OSError:
+                        pass
+            raise
+        except Exception:
+            abort.set()
+            for future in futures:
+                future.cancel()
+            concurrent.futures.wait(futures)  # 等待仍在写入的分段结束后再删除临时文件
+            for path in (part_path, state_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        
+        os.replace(part_path, save_path)
+        try:
+            os.remove(state_path)
+        except OSError:
+            pass
+        return total_size
+
+    def _find_download_record(self, url, local_path):
+        """查找该文件最近一次成功下载到local_path的记录"""
+        with self._history_lock:
+            for record in self.download_history:
+                if record["url"] == url and record["status"] == "成功" and record["local_path"] == local_path:
+                    return record
+        return None
+
+    def _local_dir_name(self, dir_url):
+        """由目录URL的最后一段生成本地文件夹名（解码后过滤非法字符，"."、".."等改为"_"）"""
+        dir_name = urllib.parse.unquote(dir_url.rstrip('/').rsplit('/', 1)[-1])
+        dir_name = dir_name.translate(self._invalid_char_table)
+        # 空名称和只由点组成的名称会指向当前或上级目录
+        if not dir_name.strip('. '):
+            dir_name = '_'
+        return dir_name
 
     def _download_directory(self, dir_url, save_root):
-        """递归下载目录"""
+        """下载整个目录（用工作队列逐层遍历子目录，不使用递归）"""
+        # 1. 规范化 URL：只处理路径部分的多余斜杠，不影响协议和查询字符串
+        parts = urllib.parse.urlsplit(dir_url)
+        # POSIX规定开头的"//"保留原样，因此先去掉开头的斜杠再规范化
+        path = posixpath.normpath('/' + parts.path.lstrip('/'))
+        dir_url = urllib.parse.urlunsplit(parts._replace(path=path.rstrip('/') + '/'))
+        
+        # 2. 待处理的目录及其保存位置，子目录保存到上级目录下的同名文件夹中
+        #    （各子目录中的同名文件并行下载时不会写入同一个文件）
+        pending_dirs = deque([(dir_url, save_root, 0)])
+        visited = {dir_url}  # 已加入队列的目录，避免服务器上的链接循环
+        root_real = os.path.realpath(save_root)
+        prefetched = 0  # 队列开头已提交预取的目录数
+        futures = {}
         try:
-            # 1. 规范化 URL
-            if not dir_url.endswith('/'):
-                dir_url = dir_url.rstrip('/') + '/'
-            # 避免替换协议部分的双斜杠
-            if '://' in dir_url:
-                protocol, rest = dir_url.split('://', 1)
-                dir_url = f'{protocol}://{rest.replace("//", "/")}'
-                # 修复URL中的协议双斜杠
-            else:
-                dir_url = dir_url.replace('//', '/')
-            
-            # 2. 提取当前目录名
-            url_parts = [p for p in dir_url.rstrip('/').split('/') if p]
-            if not url_parts:
-                raise ValueError("无法解析目录URL")
-            dir_name = url_parts[-1]  # 使用URL的最后一部分作为目录名
-            # 3. 对目录名进行URL解码
-            dir_name = urllib.parse.unquote(dir_name)
-            
-            # 4. 过滤目录名非法字符
-            for c in self.INVALID_CHARS:
-                dir_name = dir_name.replace(c, '_')
-            
-            # 5. 直接使用传入的save_root作为保存目录
-            save_dir = save_root
-            os.makedirs(save_dir, exist_ok=True)
-            
-            # 5. 检查是否需要取消下载
-            if self.cancel_download:
-                raise Exception("下载已取消")
-            
-            # 6. 请求网络获取目录内容
-            session = self._create_retry_session()
-            response = session.get(dir_url, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            pre = soup.find('pre')
-            if not pre:
-                raise ValueError("未找到目录列表")
-            
-            # 解析目录内容
-            a_tags = pre.find_all('a')
-            dir_items = []
-            for a in a_tags:
-                name = a.text.strip() if a.text else ""
-                href = a.get('href', "")
+            while pending_dirs:
+                # 3. 检查是否需要取消下载
+                if self.cancel_download:
+                    raise DownloadCancelled("下载已取消")
+                
+                current_url, save_dir, depth = pending_dirs.popleft()
+                prefetched = max(prefetched - 1, 0)
+                os.makedirs(save_dir, exist_ok=True)
+                try:
+                    # 4. 获取目录内容（优先使用预取结果）
+                    dir_items = self._get_listing(current_url)
+                except Exception as e:
+                    error_info = f"下载目录失败: {current_url}\n错误: {str(e)}"
+                    logging.error(error_info)
+                    self._update_status(error_info[:60] + "...")
+                    raise
+                
+                for item in dir_items:
+                    if item["file_type"] == "目录":
+                        # 5. 子目录加入队列（只进入本目录之下、尚未访问过的子目录）
+                        sub_url = item["full_url"]
+                        if sub_url in visited or not sub_url.startswith(dir_url):
+                            continue
+                        if depth >= self.MAX_DIRECTORY_DEPTH:
+                            logging.warning(f"子目录层数超过{self.MAX_DIRECTORY_DEPTH}，跳过: {sub_url}")
+                            continue
+                        # 目录名取自URL（列表中显示的名称可能被截断）
+                        sub_dir = os.path.join(save_dir, self._local_dir_name(sub_url))
+                        # 保存位置必须在save_root之内
+                        if not os.path.realpath(sub_dir).startswith(root_real + os.sep):
+                            logging.warning(f"子目录保存位置超出下载目录，跳过: {sub_url}")
+                            continue
+                        visited.add(sub_url)
+                        pending_dirs.append((sub_url, sub_dir, depth + 1))
+                    else:
+                        # 6. 文件提交到线程池并行下载
+                        future = self.download_pool.submit(
+                            self._download_file, item["full_url"], save_dir, False, item.get("size_bytes")
+                        )
+                        futures[future] = item["full_url"]
+                del dir_items
                 
-                if self._should_skip_item(name, href):
-                    continue
-                    
-                if not href:
-                    continue
-                    
-                full_url = urllib.parse.urljoin(dir_url, href)
-                date, size = self._parse_file_info(a)
-                file_type = "目录" if name.endswith('/') or href.endswith('/') else "文件"
+                # 按队列顺序预取接下来要处理的子目录列表，与文件下载并行进行；
+                # 达到上限时暂停，等已预取的列表被取用后再继续
+                while prefetched < len(pending_dirs) and self._prefetch_listing(pending_dirs[prefetched][0]):
+                    prefetched += 1
                 
-                dir_items.append({
-                    "name": name,
-                    "href": href,
-                    "date": date,
-                    "size": size,
-                    "file_type": file_type,
-                    "full_url": full_url
-                })
+                # 已有文件下载失败时尽早停止遍历
+                for future in [f for f in futures if f.done()]:
+                    if future.exception() is not None:
+                        logging.error(f"文件下载失败: {futures[future]} → {str(future.exception())}")
+                        raise future.exception()
+                    del futures[future]
             
-            # 7. 处理目录中的项目
-            for item in dir_items:
-                if self.cancel_download:
-                    raise Exception("下载已取消")
-                    
-                if item["file_type"] == "目录":
-                    # 递归下载子目录
-                    self._download_directory(item["full_url"], save_dir)
-                else:
-                    # 下载文件
-                    try:
-                        self._download_file(item["full_url"], save_dir, show_msg=False)
-                    except Exception as e:
-                        logging.error(f"文件下载失败: {item['full_url']} → {str(e)}")
-                        raise
-
-        except Exception as e:
-            error_info = f"下载目录失败: {dir_url}\n错误: {str(e)}"
-            logging.error(error_info)
-            self._update_status(error_info[:60] + "...")
-            raise
+            # 7. 等待所有文件下载完成，任一文件失败时抛出其异常
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_EXCEPTION
+            )
+            for future in done:
+                if future.exception() is not None:
+                    logging.error(f"文件下载失败: {futures[future]} → {str(future.exception())}")
+                    raise future.exception()
+        finally:
+            # 出错或取消时丢弃尚未开始的文件任务
+            for future in futures:
+                future.cancel()
 
     def _update_progress(self, value):
-        """在主线程中更新进度条"""
-        def update():
-            self.progress['value'] = value
-        self.root.after(0, update)
+        """在主线程中更新进度条（高频调用时只显示最新值，最多约30次/秒）"""
+        with self._progress_lock:
+            self._pending_progress = value
+            self._schedule_progress_flush()
+
+    def _schedule_progress_flush(self):
+        """安排一次界面刷新（调用方需持有_progress_lock）"""
+        if not self._progress_scheduled:
+            self._progress_scheduled = True
+            self.root.after(33, self._flush_progress)
+
+    def _flush_progress(self):
+        """在主线程中显示最新的进度和状态"""
+        with self._progress_lock:
+            progress, status = self._pending_progress, self._pending_status
+            self._pending_progress = self._pending_status = None
+            self._progress_scheduled = False
+        if progress is not None:
+            self.progress['value'] = progress
+        if status is not None:
+            self.status_label.config(text=status)
 
     def _show_info(self, message):
         """在主线程中显示信息对话框"""
@@ -1037,43 +1544,117 @@ class AstronomyDBBrowser:
         self.root.after(0, show)
 
     def load_download_history(self):
-        """加载下载历史"""
+        """在后台线程中加载下载历史，历史文件较大时不阻塞程序启动"""
+        # 每行一条JSON记录，按下载时间从旧到新追加
+        self.history_file = os.path.join(self.appdata_dir, "download_history.jsonl")
+        self._history_loaded = threading.Event()
+        threading.Thread(target=self._read_download_history, daemon=True).start()
+
+    def _read_download_history(self):
+        """读取下载历史文件，并与加载期间新增的记录合并"""
+        history = deque(maxlen=self.MAX_HISTORY)
+        lines = 0
+        migrate = False
         try:
-            self.history_file = os.path.join(self.appdata_dir, "download_history.json")
             if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    self.download_history = json.load(f)
+                with open(self.history_file, 'rb') as f:
+                    for line in f:
+                        lines += 1
+                        try:
+                            # 最新的记录在文件末尾，超出maxlen时自动丢弃最旧的记录
+                            history.appendleft(orjson.loads(line) if orjson else json.loads(line))
+                        except ValueError:
+                            # 写入中断时最后一行可能不完整
+                            logging.error(f"跳过无法解析的历史记录: {line[:100]!r}")
             else:
-                self.download_history = []
+                # 迁移旧版本的JSON列表格式（最新的在前）
+                legacy_file = os.path.join(self.appdata_dir, "download_history.json")
+                if os.path.exists(legacy_file):
+                    with open(legacy_file, 'r', encoding='utf-8') as f:
+                        history.extend(json.load(f)[:self.MAX_HISTORY])
+                    migrate = True
         except Exception as e:
             logging.error(f"加载历史记录失败: {e}")
-            self.download_history = []
+        
+        with self._history_lock:
+            # 加载期间新增的记录更新，放在最前面
+            history.extendleft(reversed(self.download_history))
+            self.download_history = history
+            self._history_lines = lines
+            if migrate:
+                self._history_rewrite = True
+                self._history_dirty = True
+        self._history_loaded.set()
+
+    def _dump_history_record(self, record):
+        """把一条历史记录序列化为一行JSON"""
+        if orjson:
+            return orjson.dumps(record) + b'\n'
+        return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
 
     def save_download_history(self):
-        """保存下载历史"""
+        """保存下载历史：新记录追加到文件末尾，删除记录或旧记录过多时才重写整个文件"""
+        # 历史文件加载完成前保存会覆盖尚未读取的记录
+        self._history_loaded.wait()
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.download_history, f, ensure_ascii=False, indent=2)
+            with self._history_lock:
+                self._history_dirty = False
+                pending, self._pending_history = self._pending_history, []
+                if (self._history_rewrite or
+                        self._history_lines + len(pending) > self.MAX_HISTORY + self.HISTORY_COMPACT_THRESHOLD):
+                    # 先写临时文件再替换，避免写入中断时损坏历史文件
+                    tmp_file = self.history_file + ".tmp"
+                    with open(tmp_file, 'wb') as f:
+                        f.writelines(self._dump_history_record(r) for r in reversed(self.download_history))
+                    os.replace(tmp_file, self.history_file)
+                    self._history_lines = len(self.download_history)
+                    self._history_rewrite = False
+                elif pending:
+                    with open(self.history_file, 'ab') as f:
+                        f.writelines(self._dump_history_record(r) for r in pending)
+                    self._history_lines += len(pending)
         except Exception as e:
             logging.error(f"保存历史记录失败: {e}")
+            # 下次保存时重写整个文件，避免丢失本次未写入的记录
+            self._history_rewrite = True
+
+    def _schedule_history_flush(self):
+        """安排写入下载历史，2秒内的多次修改合并为一次写入"""
+        if self._history_flush_after_id is None:
+            self._history_flush_after_id = self.root.after(2000, self._flush_history_if_dirty)
+
+    def _flush_history_if_dirty(self, background=True):
+        """下载历史有修改时写入磁盘（默认在后台线程执行，避免阻塞界面）"""
+        self._history_flush_after_id = None
+        if not self._history_dirty:
+            return
+        if background:
+            threading.Thread(target=self.save_download_history, daemon=True).start()
+        else:
+            self.save_download_history()
 
-    def add_download_record(self, url, local_path, status, name):
-        """添加一条下载记录"""
+    def add_download_record(self, url, local_path, status, name, etag=None, last_modified=None, size=None):
+        """添加一条下载记录（etag/last_modified/size用于下次判断文件是否需要重新下载）"""
         record = {
             "url": url,
             "local_path": local_path,
             "name": name,
             "status": status,  # "成功" 或 "失败"
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": size
         }
-        # 限制历史记录数量
-        self.download_history.insert(0, record)
-        if len(self.download_history) > self.MAX_HISTORY:
-            self.download_history = self.download_history[:self.MAX_HISTORY]
-        self.save_download_history()
+        # deque设置了maxlen，超出数量时自动丢弃最旧的记录
+        with self._history_lock:
+            self.download_history.appendleft(record)
+            self._pending_history.append(record)
+            self._history_dirty = True
+        self._schedule_history_flush()
 
     def show_download_history(self):
         """显示下载历史窗口"""
+        self._history_loaded.wait()
         if not self.download_history:
             messagebox.showinfo("下载历史", "暂无下载记录")
             return
@@ -1132,18 +1713,31 @@ class AstronomyDBBrowser:
         tree.configure(xscrollcommand=scrollbar_x.set)
 
         # 填充数据
-        def populate_tree(records):
-            for item in tree.get_children():
-                tree.delete(item)
-            for i, record in enumerate(records):
-                tree.insert("", tk.END, iid=str(i), values=(
-                    record["name"],
-                    record["time"],
-                    record["status"],
-                    record["local_path"] or "下载失败"
-                ))
-        
-        populate_tree(self.download_history)
+        sort_keys = {}  # 列名 -> 按记录序号排列的排序键（填充时计算一次）
+        shown = []  # 当前显示的记录，行ID即为其中的序号
+        def populate_tree():
+            # 下载线程会同时添加记录，在锁内取快照后再遍历
+            with self._history_lock:
+                shown[:] = self.download_history
+            records = shown
+            tree.delete(*tree.get_children())
+            rows = [
+                (record["name"], record["time"], record["status"], record["local_path"] or "下载失败")
+                for record in records
+            ]
+            # 每批行用一次Tcl foreach循环插入，避免逐行经过Python封装调用Tcl
+            insert_script = f"{tree._w} insert {{}} end -id $iid -values $values"
+            for start in range(0, len(rows), 2000):
+                batch = []
+                for i, values in enumerate(rows[start:start + 2000], start):
+                    batch += (str(i), values)
+                tree.tk.call("foreach", ("iid", "values"), batch, insert_script)
+            # 时间格式为YYYY-MM-DD HH:MM:SS，按字符串排序即为时间顺序
+            sort_keys.clear()
+            for c, col in enumerate(columns):
+                sort_keys[col] = [values[c].lower() for values in rows]
+        
+        populate_tree()
         tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
         # 右键菜单
@@ -1184,30 +1778,20 @@ class AstronomyDBBrowser:
                         tree.heading(c, text=c)
                 tree.heading(col, text=col + " ↑")
             
-            # 获取当前显示的数据
-            items = tree.get_children()
-            records = []
-            for item in items:
-                idx = int(item)
-                records.append((self.download_history[idx], idx))
-            
-            # 根据列排序
-            if col == "time":
-                records.sort(key=lambda x: datetime.strptime(x[0]["time"], "%Y-%m-%d %H:%M:%S"), reverse=reverse)
-            else:
-                records.sort(key=lambda x: x[0][col].lower(), reverse=reverse)
+            # 根据填充时计算好的排序键排序
+            keys = sort_keys[col]
+            items = sorted(tree.get_children(), key=lambda item: keys[int(item)], reverse=reverse)
             
             # 重新排列
-            for i, (_, idx) in enumerate(records):
-                tree.move(str(idx), "", i)
+            for i, item in enumerate(items):
+                tree.move(item, "", i)
 
         # 重新下载选中的记录
         def redownload_selected(tree):
             selected = tree.selection()
             if not selected:
                 return
-            record_idx = int(selected[0])
-            record = self.download_history[record_idx]
+            record = shown[int(selected[0])]
             
             history_window.destroy()  # 关闭历史窗口
             
@@ -1223,19 +1807,23 @@ class AstronomyDBBrowser:
             selected = tree.selection()
             if not selected:
                 return
-            record_idx = int(selected[0])
-            record = self.download_history[record_idx]
+            record = shown[int(selected[0])]
             
             if record["status"] == "成功" and record["local_path"] and os.path.exists(record["local_path"]):
-                try:
-                    # 跨平台打开文件夹
-                    file_dir = os.path.dirname(record["local_path"])
-                    if os.name == 'nt':  # Windows
-                        os.startfile(file_dir)
-                    else:  # macOS/Linux
-                        subprocess.run(['open' if sys.platform == 'darwin' else 'xdg-open', file_dir])
-                except Exception as e:
-                    messagebox.showerror("错误", f"无法打开文件夹: {str(e)}")
+                file_dir = os.path.dirname(record["local_path"])
+                
+                # 在后台线程中打开，文件管理器启动较慢时不阻塞界面
+                def open_dir():
+                    try:
+                        # 跨平台打开文件夹
+                        if os.name == 'nt':  # Windows
+                            os.startfile(file_dir)
+                        else:  # macOS/Linux
+                            subprocess.run(['open' if sys.platform == 'darwin' else 'xdg-open', file_dir])
+                    except Exception as e:
+                        self._show_error(f"无法打开文件夹: {str(e)}")
+                
+                threading.Thread(target=open_dir, daemon=True).start()
             else:
                 messagebox.showinfo("提示", "文件不存在或下载失败")
 
@@ -1244,12 +1832,19 @@ class AstronomyDBBrowser:
             selected = tree.selection()
             if not selected:
                 return
-            record_idx = int(selected[0])
+            record = shown[int(selected[0])]
             
-            if messagebox.askyesno("确认", f"确定要删除 '{self.download_history[record_idx]['name']}' 的记录吗？"):
-                del self.download_history[record_idx]
-                self.save_download_history()
-                populate_tree(self.download_history)
+            if messagebox.askyesno("确认", f"确定要删除 '{record['name']}' 的记录吗？"):
+                with self._history_lock:
+                    # 打开窗口后可能有新记录插在前面，按对象查找而不是按序号删除
+                    for i, r in enumerate(self.download_history):
+                        if r is record:
+                            del self.download_history[i]
+                            self._history_rewrite = True
+                            self._history_dirty = True
+                            break
+                self._schedule_history_flush()
+                populate_tree()
         
         # 清空历史
         def clear_history():
@@ -1257,9 +1852,12 @@ class AstronomyDBBrowser:
                 return
                 
             if messagebox.askyesno("确认", "确定要清空所有下载历史记录吗？"):
-                self.download_history = []
-                self.save_download_history()
-                populate_tree(self.download_history)
+                with self._history_lock:
+                    self.download_history.clear()
+                    self._history_rewrite = True
+                    self._history_dirty = True
+                self._schedule_history_flush()
+                populate_tree()
 
 if __name__ == "__main__":
     root = tk.Tk()